@@ -6,15 +6,18 @@ Telegram bot implementation for a beer selection bot.
 Includes text responses and image sending capabilities.
 """
 
+import io
 import os
+import re
+import asyncio
+import functools
 import logging
 import random
-import threading
 import pathlib
-from http.server import HTTPServer, BaseHTTPRequestHandler
 from telegram import Update, InputFile
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, AIORateLimiter
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.request import HTTPXRequest
 
 # Enable logging
 logging.basicConfig(
@@ -26,7 +29,7 @@ logger = logging.getLogger(__name__)
 
 # Get base directory for file operations
 BASE_DIR = pathlib.Path(__file__).parent.absolute()
-logger.info(f"Base directory: {BASE_DIR}")
+logger.info("Base directory: %s", BASE_DIR)
 
 # Get token from environment variable
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
@@ -36,40 +39,238 @@ if not BOT_TOKEN:
 else:
     logger.info("BOT_TOKEN found, proceeding with initialization")
 
+# Beer lineup for the "try_luck" button: 30% chance of Жигули барное,
+# the remaining 70% split evenly between the other beers
+BEER_POPULATION = ("Крушовица", "Жатецкий гусь", "Хамовники венское",
+                   "Хамовники пильзенское", "Козел", "Жигули барное")
+BEER_WEIGHTS = (0.14, 0.14, 0.14, 0.14, 0.14, 0.3)
+_BEER_INDICES = range(len(BEER_POPULATION))
+ZHIGULI_INDEX = BEER_POPULATION.index("Жигули барное")
+
+# Dedicated generator for the bot, independent of the shared module-level state
+_RNG = random.Random()
+
+# Images sent after the "try_luck" button
+HAPPY_IMAGE_PATH = os.path.join(BASE_DIR, 'zhiguli_happy.PNG')
+SAD_IMAGE_PATH = os.path.join(BASE_DIR, 'zhiguli_sad.PNG')
+
+# Image contents preloaded in main(), keyed by local path
+_IMAGE_BYTES: dict[str, bytes] = {}
+
+# Telegram file_ids of already uploaded images, keyed by local path
+_FILE_ID_CACHE: dict[str, str] = {}
+
+# Keywords for free-text messages, in priority order: when a message contains
+# keywords from several categories, the earlier category wins
+KEYWORD_CATEGORIES = (
+    ("greet", ("привет", "здравствуй")),
+    ("thanks", ("спасибо", "благодар")),
+    ("bye", ("пока", "до свидания")),
+    ("ipa", ("ipa", "ипа")),
+    ("lager", ("лагер",)),
+    ("ale", ("эль",)),
+    ("stout", ("стаут",)),
+    ("porter", ("портер",)),
+    ("wheat", ("пшеничное",)),
+    ("alcohol", ("алкоголь", "градус")),
+    ("snacks", ("закуска", "закусывать")),
+)
+_KEYWORD_TO_CATEGORY = {word.casefold(): category for category, words in KEYWORD_CATEGORIES for word in words}
+_CATEGORY_PRIORITY = {category: i for i, (category, _) in enumerate(KEYWORD_CATEGORIES)}
+# The lookahead reports a keyword at every position, but only the longest one
+# starting there, so a keyword must not be a prefix of one from another category
+if any(
+    longer.startswith(shorter) and _KEYWORD_TO_CATEGORY[longer] != _KEYWORD_TO_CATEGORY[shorter]
+    for shorter in _KEYWORD_TO_CATEGORY for longer in _KEYWORD_TO_CATEGORY if longer != shorter
+):
+    raise ValueError("A keyword is a prefix of a keyword from another category")
+_KEYWORD_PATTERN = re.compile(
+    "(?=(" + "|".join(re.escape(word) for word in sorted(_KEYWORD_TO_CATEGORY, key=len, reverse=True)) + "))"
+)
+
+# Users often send the same short phrases, so recent results are memoized
+@functools.lru_cache(maxsize=1024)
+def classify_message(text: str) -> str | None:
+    """Return the highest-priority keyword category found in text, if any."""
+    categories = {_KEYWORD_TO_CATEGORY[m.group(1)] for m in _KEYWORD_PATTERN.finditer(text)}
+    if not categories:
+        return None
+    return min(categories, key=_CATEGORY_PRIORITY.__getitem__)
+
+# Reply texts are built once at import
+HELP_TEXT = (
+    "Вот команды, которые я понимаю:\n"
+    "/start - Начать разговор\n"
+    "/help - Показать это сообщение\n"
+    "/menu - Показать меню опций\n\n"
+    "Также вы можете просто написать ваш вопрос о пиве, и я постараюсь ответить!"
+)
+
+# Inline keyboards never change, so they are built once at import
+START_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("Испытай удачу, сталкер", callback_data="try_luck")]])
+
+MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("История пива", callback_data="history"),
+        InlineKeyboardButton("Виды пива", callback_data="types")
+    ],
+    [
+        InlineKeyboardButton("Процесс варки", callback_data="brewing"),
+        InlineKeyboardButton("Культура пития", callback_data="culture")
+    ]
+])
+
+# Map callback data to text responses for the menu buttons
+BUTTON_RESPONSES = {
+    "history": "История пива насчитывает тысячи лет. Первые упоминания о пивоварении относятся к древним цивилизациям Месопотамии и Египта. Пиво было важным продуктом питания и частью культуры многих народов.",
+
+    "types": "Основные виды пива:\n- Эль (верховое брожение)\n- Лагер (низовое брожение)\n- Портер и стаут\n- Пшеничное пиво\n- IPA (India Pale Ale)\n- Ламбик (спонтанное брожение)\nКаждый вид имеет свои особенности вкуса, аромата и технологии производства.",
+
+    "brewing": "Основные этапы пивоварения:\n1. Соложение зерна\n2. Затирание и фильтрация\n3. Варка сусла с хмелем\n4. Охлаждение сусла\n5. Ферментация (брожение)\n6. Созревание пива\n7. Фильтрация и розлив\nКаждый этап критически важен для качества готового продукта.",
+
+    "culture": "Культура потребления пива различается по странам. В Германии традиционны пивные фестивали, такие как Октоберфест. В Бельгии каждый сорт пива подается в специальном бокале. В Чехии пиво - национальное достояние. Ответственное потребление и знание традиций обогащает опыт наслаждения этим напитком."
+}
+
+# Replies to free-text messages, keyed by keyword category
+MESSAGE_REPLIES = {
+    "greet": "Привет! Чем могу помочь?",
+    "thanks": "Всегда рад помочь!",
+    "bye": "До новых встреч! Надеюсь, был полезен.",
+    # Beer related questions
+    "ipa": (
+        "India Pale Ale (IPA) - это сорт пива с ярко выраженным хмелевым вкусом и ароматом. "
+        "Первоначально был создан для экспорта в Индию, отсюда и название. "
+        "Характеризуется высоким содержанием хмеля, который использовался как консервант."
+    ),
+    "lager": (
+        "Лагер - это пиво низового брожения, которое выдерживается при низких температурах. "
+        "Процесс ферментации происходит в нижней части чана, отсюда и название 'низовое'. "
+        "Лагеры обычно более легкие и освежающие, чем эли."
+    ),
+    "ale": (
+        "Эль - это пиво верхового брожения. Процесс ферментации происходит при более высоких температурах, "
+        "чем у лагера, и дрожжи работают в верхней части чана. Эли обычно имеют более насыщенный, "
+        "фруктовый вкус и аромат."
+    ),
+    "stout": (
+        "Стаут - это тёмное пиво, приготовленное с использованием жареного ячменя. "
+        "Имеет богатый, плотный вкус с нотами кофе, шоколада и солода. "
+        "Изначально термин 'стаут' означал просто 'крепкий пиво'."
+    ),
+    "porter": (
+        "Портер - это тёмное пиво, предшественник стаута. Получил популярность среди "
+        "лондонских носильщиков (porter в переводе с английского - носильщик). "
+        "Характеризуется сложным вкусом с нотами карамели, шоколада и иногда лёгкой дымностью."
+    ),
+    "wheat": (
+        "Пшеничное пиво производится с использованием значительной доли пшеничного солода. "
+        "Обычно легкое, освежающее, с высокой карбонизацией. Немецкие сорта (Weissbier) часто имеют "
+        "ноты банана и гвоздики из-за особых штаммов дрожжей."
+    ),
+    "alcohol": (
+        "Содержание алкоголя в пиве обычно составляет от 3% до 12%. "
+        "Легкое пиво может содержать 3-4%, обычные лагеры - около 5%, "
+        "крафтовые сорта часто имеют 6-9%, а некоторые специальные сорта могут "
+        "достигать 12% и выше. Помните о ответственном потреблении!"
+    ),
+    "snacks": (
+        "Традиционные закуски к пиву зависят от страны и сорта пива. "
+        "К лагерам хорошо подходят снеки, орешки, легкие сыры. К элям - более острые "
+        "и пикантные закуски. К стаутам - шоколад и десерты. "
+        "В Германии популярны колбаски и претцели, в Бельгии - сыры и морепродукты."
+    ),
+}
+
+# Fallback for unrecognized queries
+MESSAGE_FALLBACK = (
+    "Извините, я не совсем понял ваш вопрос. Попробуйте сформулировать иначе или "
+    "воспользуйтесь командой /menu, чтобы увидеть доступные темы."
+)
+
 # Simple web server to keep Render happy
-def run_web_server():
-    class Handler(BaseHTTPRequestHandler):
-        def do_GET(self):
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'Pivnoi Vopros Bot is running!')
-            
-        def log_message(self, format, *args):
-            # Suppress log messages to console
-            return
-    
+HEALTH_CHECK_RESPONSE = (
+    b'HTTP/1.1 200 OK\r\n'
+    b'Content-type: text/plain\r\n'
+    b'Content-Length: 29\r\n'
+    b'Connection: close\r\n\r\n'
+    b'Pivnoi Vopros Bot is running!'
+)
+
+async def handle_health_check(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer any HTTP request with a prebuilt plain-text response."""
+    try:
+        # The request itself doesn't matter, just wait for the end of its headers,
+        # but don't let a stalled client hold the socket open on the bot's loop
+        try:
+            await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=5)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            pass
+        writer.write(HEALTH_CHECK_RESPONSE)
+        await writer.drain()
+    except ConnectionError as e:
+        # Probes often drop the connection early, that's not worth an error
+        logger.debug("Health check client disconnected: %s", e)
+    except Exception as e:
+        logger.error("Error in health check: %s", e)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+# Running health check server, kept out of bot_data so persistence never pickles it
+_web_server: asyncio.Server | None = None
+
+async def start_web_server(application: Application) -> None:
+    """Start the health check server on the bot's event loop."""
+    global _web_server
     # Use the PORT environment variable that Render sets
     port = int(os.environ.get("PORT", 10000))
-    server = HTTPServer(('0.0.0.0', port), Handler)
-    logger.info(f"Starting web server on port {port}")
-    server.serve_forever()
+    # The health check must never keep the bot itself from starting
+    try:
+        _web_server = await asyncio.start_server(handle_health_check, '0.0.0.0', port)
+    except OSError as e:
+        logger.error("Could not start web server on port %s: %s", port, e)
+        return
+    logger.info("Starting web server on port %s", port)
+
+async def stop_web_server(application: Application) -> None:
+    """Stop the health check server."""
+    global _web_server
+    if _web_server is not None:
+        _web_server.close()
+        await _web_server.wait_closed()
+        _web_server = None
+
+async def send_cached_photo(bot, chat_id: int, path: str) -> None:
+    """Send a local image, reusing its Telegram file_id after the first upload."""
+    file_id = _FILE_ID_CACHE.get(path)
+    if file_id is not None:
+        await bot.send_photo(chat_id=chat_id, photo=file_id)
+        return
+    data = _IMAGE_BYTES.get(path)
+    if data is None:
+        with open(path, 'rb') as photo:
+            data = photo.read()
+    # InputFile consumes its stream, so wrap the bytes in a fresh buffer per upload
+    photo = InputFile(io.BytesIO(data), filename=os.path.basename(path))
+    msg = await bot.send_photo(chat_id=chat_id, photo=photo)
+    _FILE_ID_CACHE[path] = msg.photo[-1].file_id
 
 # Command handlers
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a welcome message when the command /start is issued."""
     try:
-        logger.info(f"Received /start command from user ID: {update.effective_user.id}, username: {update.effective_user.username}")
+        logger.info("Received /start command from user ID: %s, username: %s", update.effective_user.id, update.effective_user.username)
         user = update.effective_user
-        keyboard = [[InlineKeyboardButton("Испытай удачу, сталкер", callback_data="try_luck")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
             f"Привет, сталкер. Замотался? Присядь, выпей кружечку холодненького. Сейчас сделаем тебе случайную подборку из 6 зелий.",
-            reply_markup=reply_markup
+            reply_markup=START_MARKUP
         )
-        logger.info("Start command processed successfully")
+        logger.debug("Start command processed successfully")
     except Exception as e:
-        logger.error(f"Error in start command: {e}")
+        logger.error("Error in start command: %s", e)
         # Try to send error message if possible
         try:
             await update.message.reply_text("Произошла ошибка при обработке команды /start. Пожалуйста, попробуйте позже.")
@@ -79,140 +280,91 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a help message when the command /help is issued."""
     try:
-        logger.info(f"Received /help command from user ID: {update.effective_user.id}")
-        help_text = (
-            "Вот команды, которые я понимаю:\n"
-            "/start - Начать разговор\n"
-            "/help - Показать это сообщение\n"
-            "/menu - Показать меню опций\n\n"
-            "Также вы можете просто написать ваш вопрос о пиве, и я постараюсь ответить!"
-        )
-        await update.message.reply_text(help_text)
-        logger.info("Help command processed successfully")
+        logger.info("Received /help command from user ID: %s", update.effective_user.id)
+        await update.message.reply_text(HELP_TEXT)
+        logger.debug("Help command processed successfully")
     except Exception as e:
-        logger.error(f"Error in help command: {e}")
+        logger.error("Error in help command: %s", e)
 
 async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Display a menu of options with inline keyboard."""
     try:
-        logger.info(f"Received /menu command from user ID: {update.effective_user.id}")
-        keyboard = [
-            [
-                InlineKeyboardButton("История пива", callback_data="history"),
-                InlineKeyboardButton("Виды пива", callback_data="types")
-            ],
-            [
-                InlineKeyboardButton("Процесс варки", callback_data="brewing"),
-                InlineKeyboardButton("Культура пития", callback_data="culture")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("Выберите тему, которая вас интересует:", reply_markup=reply_markup)
-        logger.info("Menu command processed successfully")
+        logger.info("Received /menu command from user ID: %s", update.effective_user.id)
+        await update.message.reply_text("Выберите тему, которая вас интересует:", reply_markup=MENU_MARKUP)
+        logger.debug("Menu command processed successfully")
     except Exception as e:
-        logger.error(f"Error in menu command: {e}")
+        logger.error("Error in menu command: %s", e)
+
+async def send_zhiguli_image(bot, chat_id: int, zhiguli_count: int) -> None:
+    """Send the happy or sad image depending on how much Жигули барное was picked."""
+    image_path = HAPPY_IMAGE_PATH if zhiguli_count >= 3 else SAD_IMAGE_PATH
+    logger.debug("Sending image %s to chat ID: %s", image_path, chat_id)
+    
+    try:
+        await send_cached_photo(bot, chat_id, image_path)
+        logger.debug("Image sent successfully")
+    except FileNotFoundError:
+        logger.error("Image file not found at %s", image_path)
+        await bot.send_message(chat_id=chat_id, text="Извините, изображение не найдено.")
+    except Exception as img_err:
+        logger.error("Error sending image: %s", img_err)
+        await bot.send_message(chat_id=chat_id, text="Произошла ошибка при отправке изображения.")
+
+async def handle_try_luck(query, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Pick a random set of beers and send it together with a matching image."""
+    # Randomly select beers with 30% chance of Жигули барное
+    beer_indices = _RNG.choices(_BEER_INDICES, BEER_WEIGHTS, k=6)
+    selected_beers = [BEER_POPULATION[i] for i in beer_indices]
+    
+    # Count how many "Жигули барное" we have
+    zhiguli_count = beer_indices.count(ZHIGULI_INDEX)
+    logger.debug("Generated beer list with %s Жигули барное", zhiguli_count)
+    
+    # Create a formatted message
+    body = "\n".join(f"{i}. {beer}" for i, beer in enumerate(selected_beers, 1))
+    beer_message = f"Твой выбор, сталкер 🍺:\n\n{body}\n\nНе дай Зоне себя победить! ☢️"
+    
+    # Send the text and the image concurrently, but drop the image
+    # if the beer list itself could not be sent
+    chat_id = query.message.chat_id
+    image_task = asyncio.create_task(send_zhiguli_image(context.bot, chat_id, zhiguli_count))
+    try:
+        await query.edit_message_text(text=beer_message)
+    except BaseException:
+        image_task.cancel()
+        raise
+    logger.debug("Beer list message sent")
+    await image_task
+
+async def send_button_response(query, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send the static text for a menu button."""
+    await query.edit_message_text(text=BUTTON_RESPONSES[query.data])
+    logger.debug("Sent response for button: %s", query.data)
+
+async def handle_unknown_button(query, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Tell the user there is no information for this button."""
+    await query.edit_message_text(text="Извините, информация по этой теме временно недоступна.")
+    logger.warning("No response found for callback data: %s", query.data)
+
+# Map callback data to the coroutine handling that button
+BUTTON_HANDLERS = {"try_luck": handle_try_luck}
+BUTTON_HANDLERS.update(dict.fromkeys(BUTTON_RESPONSES, send_button_response))
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle button presses from inline keyboard."""
     try:
         query = update.callback_query
         user_id = query.from_user.id
-        logger.info(f"Received callback query from user ID: {user_id}, data: {query.data}")
+        logger.info("Received callback query from user ID: %s, data: %s", user_id, query.data)
         
         await query.answer()
-        logger.info("Callback query answered")
-
-        if query.data == "try_luck":
-            logger.info("Processing 'try_luck' button")
-            # List of beers
-            beers = ["Крушовица", "Жатецкий гусь", "Хамовники венское", 
-                     "Хамовники пильзенское", "Козел"]
-            
-            # Randomly select beers with 30% chance of Жигули барное
-            selected_beers = []
-            for _ in range(6):
-                if random.random() < 0.3:  # 30% chance for Жигули барное
-                    selected_beers.append("Жигули барное")
-                else:
-                    selected_beers.append(random.choice(beers))
-            
-            # Count how many "Жигули барное" we have
-            zhiguli_count = selected_beers.count("Жигули барное")
-            logger.info(f"Generated beer list with {zhiguli_count} Жигули барное")
-            
-            # Create a formatted message
-            beer_message = "Твой выбор, сталкер 🍺:\n\n"
-            for i, beer in enumerate(selected_beers, 1):
-                beer_message += f"{i}. {beer}\n"
-            
-            beer_message += "\nНе дай Зоне себя победить! ☢️"
-            
-            # First send the text message
-            await query.edit_message_text(text=beer_message)
-            logger.info("Beer list message sent")
-            
-            # Then send appropriate image based on Zhiguli count
-            chat_id = query.message.chat_id
-            logger.info(f"Sending image to chat ID: {chat_id}")
-            
-            try:
-                if zhiguli_count >= 3:
-                    # Use absolute path for the image
-                    happy_image_path = os.path.join(BASE_DIR, 'zhiguli_happy.PNG')
-                    logger.info(f"Attempting to send happy image from: {happy_image_path}")
-                    
-                    if os.path.exists(happy_image_path):
-                        logger.info("Happy image file exists")
-                        with open(happy_image_path, 'rb') as photo:
-                            await context.bot.send_photo(chat_id=chat_id, photo=photo)
-                        logger.info("Happy image sent successfully")
-                    else:
-                        logger.error(f"Happy image file not found at {happy_image_path}")
-                        # List directory contents for debugging
-                        logger.info(f"Directory contents: {os.listdir(BASE_DIR)}")
-                        await context.bot.send_message(chat_id=chat_id, text="Извините, изображение не найдено.")
-                else:
-                    # Use absolute path for the image
-                    sad_image_path = os.path.join(BASE_DIR, 'zhiguli_sad.PNG')
-                    logger.info(f"Attempting to send sad image from: {sad_image_path}")
-                    
-                    if os.path.exists(sad_image_path):
-                        logger.info("Sad image file exists")
-                        with open(sad_image_path, 'rb') as photo:
-                            await context.bot.send_photo(chat_id=chat_id, photo=photo)
-                        logger.info("Sad image sent successfully")
-                    else:
-                        logger.error(f"Sad image file not found at {sad_image_path}")
-                        # List directory contents for debugging
-                        logger.info(f"Directory contents: {os.listdir(BASE_DIR)}")
-                        await context.bot.send_message(chat_id=chat_id, text="Извините, изображение не найдено.")
-            except Exception as img_err:
-                logger.error(f"Error sending image: {img_err}")
-                await context.bot.send_message(chat_id=chat_id, text="Произошла ошибка при отправке изображения.")
-            
-            return
-
-        # Map callback data to text responses for other buttons
-        responses = {
-            "history": "История пива насчитывает тысячи лет. Первые упоминания о пивоварении относятся к древним цивилизациям Месопотамии и Египта. Пиво было важным продуктом питания и частью культуры многих народов.",
-            
-            "types": "Основные виды пива:\n- Эль (верховое брожение)\n- Лагер (низовое брожение)\n- Портер и стаут\n- Пшеничное пиво\n- IPA (India Pale Ale)\n- Ламбик (спонтанное брожение)\nКаждый вид имеет свои особенности вкуса, аромата и технологии производства.",
-            
-            "brewing": "Основные этапы пивоварения:\n1. Соложение зерна\n2. Затирание и фильтрация\n3. Варка сусла с хмелем\n4. Охлаждение сусла\n5. Ферментация (брожение)\n6. Созревание пива\n7. Фильтрация и розлив\nКаждый этап критически важен для качества готового продукта.",
-            
-            "culture": "Культура потребления пива различается по странам. В Германии традиционны пивные фестивали, такие как Октоберфест. В Бельгии каждый сорт пива подается в специальном бокале. В Чехии пиво - национальное достояние. Ответственное потребление и знание традиций обогащает опыт наслаждения этим напитком."
-        }
-
-        # Send the appropriate text response based on callback data
-        if query.data in responses:
-            await query.edit_message_text(text=responses[query.data])
-            logger.info(f"Sent response for button: {query.data}")
-        else:
-            await query.edit_message_text(text="Извините, информация по этой теме временно недоступна.")
-            logger.warning(f"No response found for callback data: {query.data}")
+        logger.debug("Callback query answered")
+
+        handler = BUTTON_HANDLERS.get(query.data, handle_unknown_button)
+        await handler(query, context)
     
     except Exception as e:
-        logger.error(f"Error in button_callback: {e}")
+        logger.error("Error in button_callback: %s", e)
         try:
             chat_id = update.callback_query.message.chat_id
             await context.bot.send_message(chat_id=chat_id, text="Произошла ошибка при обработке запроса.")
@@ -222,112 +374,72 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle regular text messages from users."""
     try:
-        logger.info(f"Received message from user ID: {update.effective_user.id}, text: {update.message.text[:20]}...")
-        text = update.message.text.lower()
-        
-        # Simple keyword-based responses
-        if "привет" in text or "здравствуй" in text:
-            await update.message.reply_text("Привет! Чем могу помочь?")
-        
-        elif any(word in text for word in ["спасибо", "благодар"]):
-            await update.message.reply_text("Всегда рад помочь!")
-        
-        elif any(word in text for word in ["пока", "до свидания"]):
-            await update.message.reply_text("До новых встреч! Надеюсь, был полезен.")
+        logger.info("Received message from user ID: %s, text: %s...", update.effective_user.id, update.message.text[:20])
+        text = update.message.text.casefold()
         
-        # Beer related questions
-        elif "ipa" in text or "ипа" in text:
-            await update.message.reply_text(
-                "India Pale Ale (IPA) - это сорт пива с ярко выраженным хмелевым вкусом и ароматом. "
-                "Первоначально был создан для экспорта в Индию, отсюда и название. "
-                "Характеризуется высоким содержанием хмеля, который использовался как консервант."
-            )
+        await update.message.reply_text(MESSAGE_REPLIES.get(classify_message(text), MESSAGE_FALLBACK))
         
-        elif "лагер" in text:
-            await update.message.reply_text(
-                "Лагер - это пиво низового брожения, которое выдерживается при низких температурах. "
-                "Процесс ферментации происходит в нижней части чана, отсюда и название 'низовое'. "
-                "Лагеры обычно более легкие и освежающие, чем эли."
-            )
-        
-        elif "эль" in text:
-            await update.message.reply_text(
-                "Эль - это пиво верхового брожения. Процесс ферментации происходит при более высоких температурах, "
-                "чем у лагера, и дрожжи работают в верхней части чана. Эли обычно имеют более насыщенный, "
-                "фруктовый вкус и аромат."
-            )
-        
-        elif "стаут" in text:
-            await update.message.reply_text(
-                "Стаут - это тёмное пиво, приготовленное с использованием жареного ячменя. "
-                "Имеет богатый, плотный вкус с нотами кофе, шоколада и солода. "
-                "Изначально термин 'стаут' означал просто 'крепкий пиво'."
-            )
-        
-        elif "портер" in text:
-            await update.message.reply_text(
-                "Портер - это тёмное пиво, предшественник стаута. Получил популярность среди "
-                "лондонских носильщиков (porter в переводе с английского - носильщик). "
-                "Характеризуется сложным вкусом с нотами карамели, шоколада и иногда лёгкой дымностью."
-            )
-        
-        elif "пшеничное" in text:
-            await update.message.reply_text(
-                "Пшеничное пиво производится с использованием значительной доли пшеничного солода. "
-                "Обычно легкое, освежающее, с высокой карбонизацией. Немецкие сорта (Weissbier) часто имеют "
-                "ноты банана и гвоздики из-за особых штаммов дрожжей."
-            )
-        
-        elif "алкоголь" in text or "градус" in text:
-            await update.message.reply_text(
-                "Содержание алкоголя в пиве обычно составляет от 3% до 12%. "
-                "Легкое пиво может содержать 3-4%, обычные лагеры - около 5%, "
-                "крафтовые сорта часто имеют 6-9%, а некоторые специальные сорта могут "
-                "достигать 12% и выше. Помните о ответственном потреблении!"
-            )
-        
-        elif "закуска" in text or "закусывать" in text:
-            await update.message.reply_text(
-                "Традиционные закуски к пиву зависят от страны и сорта пива. "
-                "К лагерам хорошо подходят снеки, орешки, легкие сыры. К элям - более острые "
-                "и пикантные закуски. К стаутам - шоколад и десерты. "
-                "В Германии популярны колбаски и претцели, в Бельгии - сыры и морепродукты."
-            )
-        
-        # Fallback for unrecognized queries
-        else:
-            await update.message.reply_text(
-                "Извините, я не совсем понял ваш вопрос. Попробуйте сформулировать иначе или "
-                "воспользуйтесь командой /menu, чтобы увидеть доступные темы."
-            )
-        
-        logger.info("Message handled successfully")
+        logger.debug("Message handled successfully")
     
     except Exception as e:
-        logger.error(f"Error in handle_message: {e}")
+        logger.error("Error in handle_message: %s", e)
 
 def main() -> None:
     """Start the bot."""
     try:
-        # Запускаем веб-сервер в отдельном потоке
-        web_thread = threading.Thread(target=run_web_server, daemon=True)
-        web_thread.start()
-        logger.info("Web server thread started")
+        # uvloop быстрее стандартного цикла событий asyncio при работе с сокетами,
+        # но бот работает и без него
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("uvloop is not installed, using the default asyncio event loop")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
         
         # Проверяем наличие изображений и выводим в лог
-        happy_image_path = os.path.join(BASE_DIR, 'zhiguli_happy.png')
-        sad_image_path = os.path.join(BASE_DIR, 'zhiguli_sad.png')
+        logger.info("Checking for images in %s", BASE_DIR)
+        logger.info("Happy image exists: %s", os.path.exists(HAPPY_IMAGE_PATH))
+        logger.info("Sad image exists: %s", os.path.exists(SAD_IMAGE_PATH))
         
-        logger.info(f"Checking for images in {BASE_DIR}")
-        logger.info(f"Happy image exists: {os.path.exists(happy_image_path)}")
-        logger.info(f"Sad image exists: {os.path.exists(sad_image_path)}")
+        # Загружаем изображения в память один раз
+        for image_path in (HAPPY_IMAGE_PATH, SAD_IMAGE_PATH):
+            try:
+                with open(image_path, 'rb') as image_file:
+                    _IMAGE_BYTES[image_path] = image_file.read()
+            except FileNotFoundError:
+                logger.error("Image file not found at %s", image_path)
         
         # Выводим список файлов в текущей директории
-        logger.info(f"Files in directory: {', '.join(os.listdir(BASE_DIR))}")
+        logger.info("Files in directory: %s", ', '.join(os.listdir(BASE_DIR)))
         
         # Create the Application with more robust settings
         logger.info("Building application with token")
-        application = Application.builder().token(BOT_TOKEN).build()
+        # Один пул keep-alive соединений HTTP/2 для отправки и отдельный для getUpdates
+        request = HTTPXRequest(connection_pool_size=32,
+                               http_version="2",
+                               pool_timeout=30,
+                               read_timeout=30,
+                               write_timeout=30,
+                               connect_timeout=10)
+        # Для long polling PTB прибавляет timeout из run_polling к read_timeout,
+        # так что сервер Telegram всегда успевает ответить
+        get_updates_request = HTTPXRequest(connection_pool_size=1,
+                                           http_version="2",
+                                           pool_timeout=30,
+                                           read_timeout=10,
+                                           write_timeout=30)
+        application = (Application.builder()
+                       .token(BOT_TOKEN)
+                       .request(request)
+                       .get_updates_request(get_updates_request)
+                       # Обработчики не зависят друг от друга, поэтому обновления из разных чатов
+                       # обрабатываются параллельно, а исходящие запросы ограничены лимитом Telegram
+                       .concurrent_updates(256)
+                       .rate_limiter(AIORateLimiter(overall_max_rate=30, overall_time_period=1))
+                       # Веб-сервер работает в том же цикле событий, что и бот
+                       .post_init(start_web_server)
+                       .post_shutdown(stop_web_server)
+                       .build())
 
         # Add command handlers
         logger.info("Adding command handlers")
@@ -343,20 +455,18 @@ def main() -> None:
 
         # Error handler to log errors
         async def error_handler(update, context):
-            logger.error(f"Exception while handling an update: {context.error}")
+            logger.error("Exception while handling an update: %s", context.error)
 
         application.add_error_handler(error_handler)
 
         # Start the Bot with more reliable settings
         logger.info("Starting Telegram Beer Bot")
-        application.run_polling(allowed_updates=Update.ALL_TYPES, 
-                               drop_pending_updates=True,
-                               pool_timeout=30,
-                               read_timeout=30,
-                               write_timeout=30)
+        application.run_polling(timeout=25,
+                               allowed_updates=Update.ALL_TYPES,
+                               drop_pending_updates=True)
     
     except Exception as e:
-        logger.error(f"Error in main function: {e}")
+        logger.error("Error in main function: %s", e)
 
 if __name__ == "__main__":
     main()